@@ -0,0 +1,154 @@
+"""Benchmarks for deepset comparisons.
+
+    python bench_deepset.py [name ...]
+
+Runs each named benchmark (default: all), printing timings and statistics.
+"""
+
+import operator
+import random
+import sys
+import time
+import tracemalloc
+
+from deepset import DeepSet, Summary, _compare_sets, bloom_parameters, recursive_compare
+
+
+def _record(rnd):
+    return {
+        "id": rnd.randrange(1000),
+        "tags": {frozenset(rnd.sample(range(20), 3)) for _ in range(rnd.randrange(1, 6))},
+        "path": [rnd.choice("abcdefgh") for _ in range(rnd.randrange(1, 10))],
+        "meta": {"kind": rnd.choice(("x", "y", "z")), "size": rnd.randrange(10)},
+    }
+
+
+def _pattern(rnd):
+    pattern = {}
+    if rnd.random() < 0.5:
+        pattern["tags"] = {frozenset(rnd.sample(range(20), 2))}
+    if rnd.random() < 0.5:
+        pattern["path"] = sorted(rnd.sample("abcdefgh", 3))
+    if rnd.random() < 0.5:
+        pattern["meta"] = {"kind": rnd.choice(("x", "y", "z"))}
+    return pattern
+
+
+def bench_summary(records=2000, patterns=50, seed=1):
+    """Measures the rate at which cached Summaries reject non-subsets, and the resulting speedup."""
+    rnd = random.Random(seed)
+    bits, hashes = bloom_parameters(200, 0.01)
+    datas = [_record(rnd) for _ in range(records)]
+    pats = [_pattern(rnd) for _ in range(patterns)]
+
+    beg = time.perf_counter()
+    falses = sum(not recursive_compare(p, d, operator.le) for p in pats for d in datas)
+    plain = time.perf_counter() - beg
+
+    beg = time.perf_counter()
+    datas = [DeepSet(d, summary=Summary(d, bits, hashes)) for d in datas]
+    pats = [DeepSet(p, summary=Summary(p, bits, hashes)) for p in pats]
+    summarizing = time.perf_counter() - beg
+
+    beg = time.perf_counter()
+    assert falses == sum(not p <= d for p in pats for d in datas)
+    summarized = time.perf_counter() - beg
+
+    rejected = 0
+    for p in pats:
+        for d in datas:
+            if not d.summary.covers(p.summary):
+                # Every rejection must be a non-subset
+                assert not recursive_compare(p.data, d.data, operator.le)
+                rejected += 1
+
+    total = records * patterns
+    print(f"summary: {total} comparisons, {falses} FALSE ({falses / total:.1%})")
+    print(
+        f"summary: {rejected} rejected by Summary ({rejected / max(falses, 1):.1%} of FALSE),"
+        f" Bloom {bits} bits, {hashes} hashes"
+    )
+    print(
+        f"summary: {plain:.3f}s plain, {summarized:.3f}s summarized ({plain / summarized:.2f}x),"
+        f" {summarizing:.3f}s to summarize"
+    )
+
+
+def bench_records(rows=5000, patterns=200, seed=1):
+    """Compares lists of patterns to a long list of database-like rows, column-wise and row-wise."""
+    import deepset
+
+    rnd = random.Random(seed)
+    table = [
+        {"id": i, "name": f"n{i % 97}", "kind": rnd.choice("xyz"), "size": rnd.randrange(1000)}
+        for i in range(rows)
+    ]
+    pats = [
+        [{"kind": rnd.choice("xyz"), "size": rnd.randrange(1000)} for _ in range(rnd.randrange(5))]
+        for _ in range(patterns)
+    ]
+
+    # Patterns matching within the first few rows, so little of the table need be examined
+    early = [[{"id": i}, {"kind": table[i + 1]["kind"]}] for i in range(patterns)]
+
+    def timed(pats):
+        beg = time.perf_counter()
+        results = [recursive_compare(p, table) for p in pats]
+        return results, time.perf_counter() - beg
+
+    records_min = deepset.RECORDS_MIN
+    for name, ps in (("scan", pats), ("early", early)):
+        columnar, columnar_time = timed(ps)
+        deepset.RECORDS_MIN = rows + 1
+        try:
+            rowwise, rowwise_time = timed(ps)
+        finally:
+            deepset.RECORDS_MIN = records_min
+        assert columnar == rowwise
+
+        print(f"records: {name}: {patterns} patterns x {rows} rows, {sum(columnar)} matched")
+        print(
+            f"records: {name}: {rowwise_time:.3f}s row-wise, {columnar_time:.3f}s column-wise"
+            f" ({rowwise_time / columnar_time:.2f}x)"
+        )
+
+
+def bench_sets(pairs=1000, repeat=100, seed=1):
+    """Compares sets of small frozensets, measuring time and peak memory allocated."""
+    rnd = random.Random(seed)
+
+    def fsets(n):
+        return {frozenset(rnd.sample(range(8), rnd.randrange(1, 4))) for _ in range(n)}
+
+    cases = [(fsets(rnd.randrange(1, 5)), fsets(rnd.randrange(1, 9))) for _ in range(pairs)]
+    total = pairs * repeat
+
+    beg = time.perf_counter()
+    for _ in range(repeat):
+        for a, b in cases:
+            _compare_sets(a, b)
+    elapsed = time.perf_counter() - beg
+
+    # Peak bytes allocated during each comparison
+    allocated = 0
+    tracemalloc.start()
+    for a, b in cases:
+        tracemalloc.clear_traces()
+        _compare_sets(a, b)
+        allocated += tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    print(f"sets: {total} comparisons in {elapsed:.3f}s ({total / elapsed:.0f}/s)")
+    print(f"sets: tracemalloc {allocated / pairs:.0f} bytes peak per comparison")
+
+
+BENCHMARKS = {
+    "summary": bench_summary,
+    "records": bench_records,
+    "sets": bench_sets,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -1,5 +1,6 @@
+import math
 import operator
-from collections import abc
+from collections import OrderedDict, abc
 from enum import IntEnum
 
 
@@ -28,6 +29,10 @@ class ComparisonResult(IntEnum):
     EQ = 3  # Equal (a == b, identical)
 
 
+# Minimum length of a list of records compared column-wise, by _compare_records
+RECORDS_MIN = 16
+
+
 class ZipCompareError(ValueError):
     pass
 
@@ -71,16 +76,135 @@ def zip_compare(a, b, op=operator.le):
         yield (ai, x), (bi, y)
 
 
-def recursive_compare(a, b, op=operator.le):
+def bloom_parameters(count, rate=0.01):
+    """Returns the (bits, hashes) Bloom filter size yielding the desired false-positive `rate`,
+    for a Summary of data containing about `count` key-paths and leaves.
+
+    A false positive here is an item of a that is absent from b, but whose bits happen to all be
+    set in b's Bloom filter; the non-subset is then not rejected early (but is still correctly
+    detected by the full recursive comparison).  Summaries must share the same (bits, hashes) to
+    be comparable, so size them for the largest data to be compared.
+    """
+    count = max(count, 1)
+    bits = max(int(math.ceil(-count * math.log(rate) / math.log(2) ** 2)), 8)
+    hashes = max(int(round(bits / count * math.log(2))), 1)
+    return bits, hashes
+
+
+class Summary:
+    """A structural signature of some data, for fast rejection of a <= b comparisons.
+
+    Records a Bloom filter of every container, key-path and leaf value (by the path of container
+    kinds and mapping keys leading to it), and the maximum length of the sequences found at each
+    path.  If a <= b, then each of these in a must also appear at the same path in b, and each of
+    a's sequences can be no longer than some sequence at the same path in b.  So, if b's Summary
+    doesn't cover a's, we know a cannot be <= b without recursively comparing them.
+
+    Leaves per type are deliberately not counted: sets allow many items of a to match one item of
+    b, and literals of different types may compare equal (eg. 1 == 1.0 == True), so such counts
+    cannot soundly reject anything.
+
+    The Bloom filter is built from hash(), which (for str, bytes, ...) is salted per process; so a
+    Summary records its process' `salt`, and Summaries with different salts (eg. unpickled in
+    another process) are never used to reject a comparison.
+
+    Unhashable leaves and (non-reiterable) iterators are not summarized, nor can we trust the paths
+    of types whose == might hold across the mapping/set/sequence/literal split used by
+    _get_comparison_strength (eg. b"ab" == bytearray(b"ab")).  If any appear in a or b, its
+    Summary is not `exact`, and the two can never be used to reject a comparison.
+    """
+
+    BITS = 1024
+    HASHES = 3
+
+    # Path element tags, distinguishing the kinds of container on the path to each item
+    _MAPPING = 1
+    _SET = 2
+    _SEQUENCE = 3
+
+    # The __eq__ of types never equal to a different kind of container or literal.
+    _EQS = frozenset(
+        t.__eq__
+        for t in (object, int, float, complex, str, dict, OrderedDict, list, tuple, set, frozenset)
+    ) | {abc.Mapping.__eq__, abc.Set.__eq__}
+
+    # Differs between processes iff their str hashes do
+    SALT = hash("deepset.Summary")
+
+    def __init__(self, data, bits=None, hashes=None):
+        self.bits = bits or self.BITS
+        self.hashes = hashes or self.HASHES
+        self.salt = self.SALT
+        self.bloom = 0
+        self.lengths = {}
+        self.exact = True
+        self._walk(data, 0)
+
+    def _add(self, item):
+        h = hash(item) & 0xFFFFFFFFFFFFFFFF
+        h1, h2 = h & 0xFFFFFFFF, (h >> 32) | 1
+        for i in range(self.hashes):
+            self.bloom |= 1 << ((h1 + i * h2) % self.bits)
+
+    def _walk(self, data, path):
+        if type(data).__eq__ not in self._EQS:
+            self.exact = False
+        if isinstance(data, abc.Mapping):
+            node = hash((path, self._MAPPING))
+            self._add(node)
+            for k, v in data.items():
+                key = hash((node, k))
+                self._add(key)
+                self._walk(v, key)
+        elif isinstance(data, abc.Set):
+            node = hash((path, self._SET))
+            self._add(node)
+            for x in data:
+                self._walk(x, node)
+        elif isinstance(data, abc.Iterator):
+            # Summarizing would consume it, leaving nothing to compare
+            self.exact = False
+        elif isinstance(data, abc.Iterable) and not isinstance(data, (str, bytes)):
+            node = hash((path, self._SEQUENCE))
+            self._add(node)
+            length = 0
+            for x in data:
+                self._walk(x, node)
+                length += 1
+            if length >= self.lengths.get(node, 0):
+                self.lengths[node] = length
+        else:
+            try:
+                self._add((path, data))
+            except TypeError:
+                # An unhashable leaf; it could compare equal to anything.
+                self.exact = False
+
+    def covers(self, other):
+        """Returns False if the data summarized by other definitely cannot be <= our data."""
+        if not (self.exact and other.exact) or self.salt != other.salt:
+            return True
+        if self.bits == other.bits and self.hashes == other.hashes and other.bloom & ~self.bloom:
+            return False
+        lengths = self.lengths
+        return all(lengths.get(node, -1) >= length for node, length in other.lengths.items())
+
+
+def recursive_compare(a, b, op=operator.le, summaries=None):
     """Recursively apply `op` (only <, <=, =) to all nested elements of a and b.
 
-    Returns True if the relationship between a and b satisfies the requested operator.
+    Returns True if the relationship between a and b satisfies the requested operator.  If the
+    (a, b) Summary `summaries` are supplied, they are used to quickly reject non-subsets.
     """
     assert op in (operator.le, operator.lt, operator.eq)
 
     # Get the actual relationship strength
-    result = _get_comparison_strength(a, b)
+    result = _get_comparison_strength(a, b, summaries=summaries)
+    return _satisfies(result, op)
 
+
+def _satisfies(result, op):
+    """Returns True if the ComparisonResult satisfies the requested operator."""
     # Map result to boolean based on requested operator
     if op == operator.eq:
         return result == ComparisonResult.EQ
@@ -92,7 +216,7 @@ def recursive_compare(a, b, op=operator.le):
     return False
 
 
-def _get_comparison_strength(a, b):
+def _get_comparison_strength(a, b, summaries=None):
     """Returns the strongest valid relationship between a and b.
 
     Returns ComparisonResult enum indicating:
@@ -100,7 +224,12 @@ def _get_comparison_strength(a, b):
     - LE: a <= b (subset, may have extras in b)
     - LT: a < b (strict subset, has extras in b)
     - FALSE: no valid relationship (items in a not found in b)
+
+    If the (a, b) Summary `summaries` are supplied, they are consulted first; if b's Summary
+    doesn't cover a's, returns FALSE without recursing.
     """
+    if summaries is not None and not summaries[1].covers(summaries[0]):
+        return ComparisonResult.FALSE
     if isinstance(a, abc.Mapping) and isinstance(b, abc.Mapping):
         return _compare_mappings(a, b)
     elif isinstance(a, abc.Set) and isinstance(b, abc.Set):
@@ -139,17 +268,21 @@ def _compare_mappings(a, b):
     return result
 
 
+# Scratch sets reused by _compare_sets, instead of allocating new ones on every call.  Each call
+# (including recursive calls on nested sets) takes its own from the pool, and returns them cleared.
+_scratch = []
+
+
 def _compare_sets(a, b):
-    """Compare two sets and return relationship strength."""
-    # Check for items in a not found in b first.
-    a_used = a & b
-    b_used = a_used.copy()
-    a_uniq = a - a_used
-    b_uniq = b - a_used
-
-    # If sets are trivially identical or a is empty (no possibility of matching
-    # any b's), we can short circuit.
-    if len(a_used) == len(a):
+    """Compare two sets and return relationship strength.
+
+    Allocates no intersections, differences or copies of a and b.  Items of b are either "unique"
+    (not in a, and not yet matched by any item of a) or "used", determined by membership tests;
+    the b items matched so far are tracked in scratch sets reused across calls.
+    """
+    # If sets are trivially identical or a is empty (no possibility of matching any b's), we can
+    # short circuit.  A subset test allocates nothing, and can't succeed if len(a) > len(b).
+    if len(a) <= len(b) and a <= b:
         if len(b) == len(a):
             return ComparisonResult.EQ
         if len(a) == 0:
@@ -161,56 +294,188 @@ def _compare_sets(a, b):
     # least the same as result.
     result = ComparisonResult.LE
 
-    # Scan the not trivially equal items against each-other, first.  Then scan
-    # the trivially equal items. When a comparison at least as good as the
-    # current result is found, we can quit.  Otherwise, the best match found
-    # after a full a x b scan is the result.
-    for x in a_uniq:
-        # Try to find a match in b_uniq first, then b_used.  Avoid re-processing
-        # relocated y's
-        best = ComparisonResult.FALSE
-        b_move = set()
-
-        for y in b_uniq:
-            child_result = _get_comparison_strength(x, y)
-            if child_result != ComparisonResult.FALSE:
-                # It matched <=/<, so we can continue
-                a_used.add(x)
-                b_move.add(y)
-                best = max(best, child_result)
-                if best >= result:
-                    break
-        else:
-            # Try to find a match in already used items from b
-            for y in b_used:
+    b_moved = _scratch.pop() if _scratch else set()
+    b_move = _scratch.pop() if _scratch else set()
+    try:
+        # Scan the not trivially equal items against each-other, first.  Then scan
+        # the trivially equal items. When a comparison at least as good as the
+        # current result is found, we can quit.  Otherwise, the best match found
+        # after a full a x b scan is the result.
+        for x in a:
+            if x in b:
+                continue
+            # Try to find a match in unique b items first, then used b items.  Avoid
+            # re-processing relocated y's
+            best = ComparisonResult.FALSE
+            for y in b:
+                if y in a or y in b_moved:
+                    continue
                 child_result = _get_comparison_strength(x, y)
                 if child_result != ComparisonResult.FALSE:
-                    a_used.add(x)
+                    # It matched <=/<, so we can continue
+                    b_move.add(y)
                     best = max(best, child_result)
                     if best >= result:
                         break
             else:
-                # No comparison at least as good as result found for this a item,
-                # in any b!  New baseline result.
-                result = min(best, result)
-        b_used |= b_move
-        b_uniq -= b_move
-        if result == ComparisonResult.FALSE:
-            return result
+                # Try to find a match in already used items from b
+                for y in b:
+                    if y not in a and y not in b_moved:
+                        continue
+                    child_result = _get_comparison_strength(x, y)
+                    if child_result != ComparisonResult.FALSE:
+                        best = max(best, child_result)
+                        if best >= result:
+                            break
+                else:
+                    # No comparison at least as good as result found for this a item,
+                    # in any b!  New baseline result.
+                    result = min(best, result)
+            b_moved |= b_move
+            b_move.clear()
+            if result == ComparisonResult.FALSE:
+                return result
+
+        # If we get here, and we're still <= but have b items unmatched, see if any a items match
+        # them.  We're looking for an excuse to return LE, instead of defaulting to LT due to
+        # remaining unmatched b items; previously used a items could also match these.
+        if result == ComparisonResult.LE:
+            for y in b:
+                if y in a or y in b_moved:
+                    continue
+                for x in a:
+                    child_result = _get_comparison_strength(x, y)
+                    if child_result >= result:
+                        break
+                else:
+                    # No element of a was at best LE; We must return LT
+                    result = ComparisonResult.LT
+                    break
 
-    # If we get here, and we're still <= but have b items unmatched, see if any a items match them.
-    # We're looking for an excuse to return LE, instead of defaulting to LT due to remaining
-    # unmatched b items; previously used a items could also match these.
-    if result == ComparisonResult.LE:
-        for y in b_uniq:
-            for x in a:
-                child_result = _get_comparison_strength(x, y)
-                if child_result >= result:
+        return result
+    finally:
+        b_moved.clear()
+        b_move.clear()
+        _scratch.append(b_moved)
+        _scratch.append(b_move)
+
+
+def _is_literal(a):
+    """Returns True if a is always compared by equality, regardless of what it is compared to."""
+    return not isinstance(a, (abc.Mapping, abc.Set)) and (
+        not isinstance(a, abc.Iterable) or isinstance(a, (str, bytes))
+    )
+
+
+def _is_records(a_list, b_list):
+    """Detects a list of mappings compared to a long list of (possibly) records; that each are
+    mappings with equal keys is only confirmed by _compare_records, as it examines them.
+    """
+    return (
+        len(b_list) >= RECORDS_MIN
+        and isinstance(b_list[0], abc.Mapping)
+        and all(isinstance(x, abc.Mapping) for x in a_list)
+    )
+
+
+class _NotRecords(Exception):
+    pass
+
+
+def _compare_records(a_list, b_list):
+    """Compare a list of mappings to a list of records, and return relationship strength, or None
+    if b_list turns out not to be records (mappings with equal keys).
+
+    Implements the same ordered-subsequence semantics as zip_compare, but the records are
+    transposed (lazily, by key) into columns.  The next candidate record for each item of a is
+    found by scanning the columns of its literal values until they all agree on a record, and
+    only then are its remaining values compared.  Keys are checked once per item of a, not once
+    per record.  Records are checked and transposed in blocks (doubling in size) only as they
+    are reached, so the work remains proportional to the records examined.
+    """
+    b_keys = set(b_list[0].keys())
+    columns = {}
+    built = 0
+
+    def grow():
+        """Checks and transposes the next block of records; returns False if there are no more."""
+        nonlocal built
+        block = b_list[built : built + max(built, RECORDS_MIN)]
+        if not block:
+            return False
+        if not all(issubclass(t, abc.Mapping) for t in set(map(type, block))) or not all(
+            y.keys() == b_keys for y in block
+        ):
+            raise _NotRecords()
+        for k, col in columns.items():
+            col.extend(map(operator.itemgetter(k), block))
+        built += len(block)
+        return True
+
+    def column(k):
+        col = columns.get(k)
+        if col is None:
+            col = columns[k] = list(map(operator.itemgetter(k), b_list[:built]))
+        return col
+
+    def find(col, v, start):
+        """Returns the index of the next record from start having value v in column col."""
+        while True:
+            try:
+                return col.index(v, start)
+            except ValueError:
+                start = max(start, built)
+                if not grow():
+                    raise
+
+    result = ComparisonResult.EQ
+    bi = 0
+    try:
+        for x in a_list:
+            if not b_keys.issuperset(x.keys()):
+                # No record has all x's keys; but only if they are all records
+                while grow():
+                    pass
+                return ComparisonResult.FALSE
+            initial = ComparisonResult.LT if len(b_keys) > len(x) else ComparisonResult.EQ
+            literals = []
+            others = []
+            for k, v in x.items():
+                (literals if _is_literal(v) else others).append((column(k), v))
+
+            # Find the next record with all of x's literals and at least <= all its other values
+            while True:
+                try:
+                    agreed = None
+                    while agreed != bi:
+                        agreed = bi
+                        for col, v in literals:
+                            bi = find(col, v, bi)
+                except ValueError:
+                    return ComparisonResult.FALSE
+                while bi >= built:
+                    if not grow():
+                        return ComparisonResult.FALSE
+                best = initial
+                if all(v == col[bi] for col, v in literals):
+                    for col, v in others:
+                        best = min(best, _get_comparison_strength(v, col[bi]))
+                        if best == ComparisonResult.FALSE:
+                            break
+                else:
+                    best = ComparisonResult.FALSE
+                if best != ComparisonResult.FALSE:
                     break
-            else:
-                # No element of a was at best LE; We must return LT
-                result = ComparisonResult.LT
-                break
+                bi += 1
+
+            result = min(result, best)
+            bi += 1
+    except _NotRecords:
+        return None
+
+    # Check if b has unmatched elements (makes it LT if we had EQ)
+    if len(a_list) < len(b_list) and result == ComparisonResult.EQ:
+        result = ComparisonResult.LT
 
     return result
 
@@ -220,6 +485,11 @@ def _compare_iterables(a, b):
     a_list = list(a)
     b_list = list(b)
 
+    if _is_records(a_list, b_list):
+        result = _compare_records(a_list, b_list)
+        if result is not None:
+            return result
+
     try:
         # Use zip_compare to find matching pairs
         result = ComparisonResult.EQ
@@ -246,39 +516,239 @@ def _compare_iterables(a, b):
 
 
 class DeepSet:
-    def __init__(self, data):
+    """Wraps data for recursive subset comparison.
+
+    If `summary` is True (or a Summary of data), a Summary is computed once (on first use) and
+    cached, and is used to quickly reject comparisons against other summarized DeepSets.  The
+    cached Summary is never updated, so summarized data must not be mutated; wrap it in a new
+    DeepSet after any change.  A Summary computed in another process (eg. unpickled) is recomputed.
+    """
+
+    def __init__(self, data, summary=False):
         self.data = data
+        self._summary = summary
+
+    @property
+    def summary(self):
+        if self._summary is True:
+            self._summary = Summary(self.data)
+        elif self._summary and self._summary.salt != Summary.SALT:
+            self._summary = Summary(self.data, self._summary.bits, self._summary.hashes)
+        return self._summary or None
+
+    def _summaries(self, other):
+        """Returns our and other's Summary, iff both are summarized."""
+        if self._summary and other._summary:
+            return self.summary, other.summary
+        return None
 
     def __eq__(self, other):
         if not isinstance(other, DeepSet):
             other = DeepSet(other)
-        return recursive_compare(self.data, other.data, operator.eq)
+        return recursive_compare(
+            self.data, other.data, operator.eq, summaries=self._summaries(other)
+        )
 
     def __ne__(self, other):
         if not isinstance(other, DeepSet):
             other = DeepSet(other)
-        return not recursive_compare(self.data, other.data, operator.eq)
+        return not recursive_compare(
+            self.data, other.data, operator.eq, summaries=self._summaries(other)
+        )
 
     def __lt__(self, other):
         if not isinstance(other, DeepSet):
             other = DeepSet(other)
-        return recursive_compare(self.data, other.data, operator.lt)
+        return recursive_compare(
+            self.data, other.data, operator.lt, summaries=self._summaries(other)
+        )
 
     def __le__(self, other):
         if not isinstance(other, DeepSet):
             other = DeepSet(other)
-        return recursive_compare(self.data, other.data, operator.le)
+        return recursive_compare(
+            self.data, other.data, operator.le, summaries=self._summaries(other)
+        )
 
     def __ge__(self, other):
         if not isinstance(other, DeepSet):
             other = DeepSet(other)
-        return recursive_compare(other.data, self.data, operator.le)
+        return recursive_compare(
+            other.data, self.data, operator.le, summaries=other._summaries(self)
+        )
 
     def __gt__(self, other):
         if not isinstance(other, DeepSet):
             other = DeepSet(other)
-        return recursive_compare(other.data, self.data, operator.lt)
+        return recursive_compare(
+            other.data, self.data, operator.lt, summaries=other._summaries(self)
+        )
+
+
+def deepset(data, summary=False):
+    return DeepSet(data, summary=summary)
+
+
+# Command-line operators: (op, reversed); eg. ge compares record <= pattern
+OPS = {
+    "lt": (operator.lt, False),
+    "le": (operator.le, False),
+    "eq": (operator.eq, False),
+    "ge": (operator.le, True),
+    "gt": (operator.lt, True),
+}
 
+_filter_args = None
 
-def deepset(data):
-    return DeepSet(data)
+
+def _filter_init(pattern, op, classify):
+    global _filter_args
+    _filter_args = pattern, OPS[op], classify
+
+
+def _filter_chunk(chunk):
+    """Filters (or classifies) a chunk of JSONL records, returning (records, matched, invalid,
+    output).
+    """
+    import json
+
+    pattern, (op, reverse), classify = _filter_args
+    records = matched = invalid = 0
+    output = []
+    for line in chunk.splitlines(keepends=True):
+        # Records too deeply nested to parse or compare are invalid, too
+        try:
+            record = json.loads(line)
+            a, b = (record, pattern) if reverse else (pattern, record)
+            result = _get_comparison_strength(a, b) if classify else recursive_compare(a, b, op)
+        except (ValueError, RecursionError):
+            # Blank lines aren't invalid, but are classified so output lines up with input
+            invalid += bool(line.strip())
+            if classify:
+                output.append(b"INVALID\n")
+            continue
+        records += 1
+        if classify:
+            matched += _satisfies(result, op)
+            output.append(f"{result.name}\n".encode())
+        elif result:
+            matched += 1
+            output.append(line if line.endswith(b"\n") else line + b"\n")
+    return records, matched, invalid, b"".join(output)
+
+
+def _read_chunks(f, size):
+    """Yields chunks of about size bytes from binary file f, each ending on a line boundary."""
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            return
+        yield chunk + f.readline()
+
+
+def _input_chunks(paths, size):
+    import sys
+
+    if not paths:
+        yield from _read_chunks(sys.stdin.buffer, size)
+    for path in paths:
+        with open(path, "rb", buffering=size) as f:
+            yield from _read_chunks(f, size)
+
+
+def main(argv=None):
+    """Streams JSONL records, printing those satisfying pattern OP record (or, with --classify, the
+    ComparisonResult of each line, or INVALID if it isn't a JSON record).  In either case, a record
+    matches if it satisfies pattern OP record; exits 0 if any record matched, 1 if none did, or 2
+    if the pattern couldn't be loaded.
+    """
+    # Only the command line needs these; importing the library shouldn't pay for them
+    import argparse
+    import json
+    import multiprocessing
+    import os
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(
+        prog="deepset",
+        description="Filter JSONL records by recursive subset comparison with a JSON pattern.",
+    )
+    parser.add_argument("pattern", help="JSON file containing the pattern")
+    parser.add_argument("files", nargs="*", help="JSONL files to filter (default: stdin)")
+    parser.add_argument(
+        "-o", "--op", choices=sorted(OPS), default="le", help="require pattern OP record (le)"
+    )
+    parser.add_argument(
+        "-c",
+        "--classify",
+        action="store_true",
+        help="print the ComparisonResult (or INVALID) of each line",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes (CPU count)"
+    )
+    parser.add_argument(
+        "--chunk", type=int, default=1 << 20, help="input chunk size, in bytes (1048576)"
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true", help="do not report throughput statistics"
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.pattern) as f:
+            pattern = json.load(f)
+    except (OSError, ValueError) as exc:
+        print(f"deepset: {args.pattern}: {exc}", file=sys.stderr)
+        return 2
+
+    records = matched = invalid = size = 0
+    out = sys.stdout.buffer
+    beg = time.perf_counter()
+
+    def chunks():
+        nonlocal size
+        for chunk in _input_chunks(args.files, args.chunk):
+            size += len(chunk)
+            yield chunk
+
+    initargs = (pattern, args.op, args.classify)
+    if args.jobs > 1:
+        pool = multiprocessing.Pool(args.jobs, initializer=_filter_init, initargs=initargs)
+        results = pool.imap(_filter_chunk, chunks())
+    else:
+        pool = None
+        _filter_init(*initargs)
+        results = map(_filter_chunk, chunks())
+    try:
+        for chunk_records, chunk_matched, chunk_invalid, output in results:
+            records += chunk_records
+            matched += chunk_matched
+            invalid += chunk_invalid
+            out.write(output)
+        out.flush()
+    except BrokenPipeError:
+        # Like grep, quietly stop when the reader goes away (eg. | head); redirect stdout to
+        # devnull, so the interpreter's final flush doesn't fail again.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), out.fileno())
+        return 0 if matched else 1
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    if not args.quiet:
+        elapsed = max(time.perf_counter() - beg, 1e-9)
+        print(
+            f"deepset: {records} records ({matched} matched, {invalid} invalid),"
+            f" {size / 1e6:.1f} MB in {elapsed:.3f}s: {records / elapsed:.0f} records/s,"
+            f" {size / 1e6 / elapsed:.1f} MB/s",
+            file=sys.stderr,
+        )
+    return 0 if matched else 1
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(main())
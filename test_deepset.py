@@ -1,13 +1,23 @@
 import operator
+import os
+import random
+import subprocess
+import sys
 
 import pytest
 
+import deepset as deepset_module
 from deepset import (
     ComparisonResult,
     DeepSet,
+    Summary,
+    _compare_records,
     _compare_sets,
     _get_comparison_strength,
+    _is_records,
+    bloom_parameters,
     deepset,
+    main,
     zip_compare,
 )
 
@@ -17,6 +27,15 @@ class TestBasics:
         assert _compare_sets(frozenset({1}), frozenset({1, 2, 3})) == ComparisonResult.LT
         assert _compare_sets(frozenset({1, 2, 3}), frozenset({1, 2, 3})) == ComparisonResult.EQ
 
+    def test_compare_frozensets(self):
+        """Test that nested frozensets compare without mutating (or copying) either set"""
+        a = frozenset({frozenset({1}), frozenset({5})})
+        b = frozenset({frozenset({1, 2}), frozenset({5})})
+        assert _compare_sets(a, b) == ComparisonResult.LT
+        assert _compare_sets(b, a) == ComparisonResult.FALSE
+        assert deepset(a) < b
+        assert deepset_module._scratch and not any(deepset_module._scratch)
+
 
 class TestDeepSetSets:
     def test_set_subset_comparison(self):
@@ -440,3 +459,216 @@ class TestComparisonStrength:
         # Lists with extra elements
         assert deepset([1, 2]) < [1, 2, 3]
         assert not deepset([1, 2]) < [1, 2]
+
+
+class TestSummary:
+    def test_summary_rejects(self):
+        """Test that Summary covers subsets, and rejects data with missing leaves or key-paths"""
+        b = {"a": 1, "b": [1, 2, 3], "c": {frozenset({1, 2})}}
+        sb = Summary(b)
+        assert sb.exact
+        for a in ({"a": 1}, {"b": [1, 3]}, {"c": {frozenset({1})}}, b):
+            assert sb.covers(Summary(a))
+        for a in ({"a": 2}, {"d": 1}, {"b": [1, 2, 3, 4]}, {"c": {frozenset({3})}}, {"a": []}):
+            assert not sb.covers(Summary(a))
+            assert _get_comparison_strength(a, b) == ComparisonResult.FALSE
+
+    def test_summary_cross_type_equality(self):
+        """Test that equal literals of different types aren't rejected"""
+        assert Summary([1, 2.0]).covers(Summary([True, 2]))
+        assert deepset([True, 2], summary=True) <= deepset([1, 2.0], summary=True)
+
+    def test_summary_inexact(self):
+        """Test that unhashable leaves or iterators in b disable rejection"""
+
+        class Unhashable:
+            __hash__ = None
+
+        assert not Summary([Unhashable()]).exact
+        assert Summary([Unhashable()]).covers(Summary([1]))
+        it = iter([1, 2])
+        assert not Summary(it).exact
+        assert list(it) == [1, 2]
+
+    def test_summary_cross_kind_equality(self):
+        """Test that values equal across kinds (eg. bytes == bytearray) disable rejection"""
+        a, b = {"k": b"ab"}, {"k": bytearray(b"ab")}
+        assert not Summary(a).exact and not Summary(b).exact
+        assert deepset(a, summary=True) <= deepset(b, summary=True)
+        assert deepset(b, summary=True) <= deepset(a, summary=True)
+
+        class Anything:
+            def __eq__(self, other):
+                return True
+
+            __hash__ = object.__hash__
+
+        assert Summary([1]).covers(Summary([Anything()]))
+        assert deepset([Anything()], summary=True) <= deepset([[1]], summary=True)
+
+    def test_summary_cached(self):
+        """Test that DeepSet caches its Summary, and uses it only when both sides have one"""
+        b = deepset({"a": [1, 2, 3]}, summary=True)
+        assert b.summary is b.summary
+        assert deepset({1}).summary is None
+        assert deepset({"a": [1, 3]}, summary=True) < b
+        assert not deepset({"a": [4]}, summary=True) <= b
+        assert b >= deepset({"a": [1]}, summary=True)
+        assert b > {"a": [1]}
+
+    def test_summary_pickled(self, tmp_path):
+        """Test that a Summary pickled under another str hash seed isn't used to reject"""
+        path = str(tmp_path / "summarized.pickle")
+        dump = (
+            "import pickle, sys; from deepset import deepset\n"
+            "d = deepset({'kind': 'x'}, summary=True); d.summary\n"
+            "pickle.dump(d, open(sys.argv[1], 'wb'))"
+        )
+        load = (
+            "import pickle, sys; from deepset import Summary, deepset\n"
+            "d = pickle.load(open(sys.argv[1], 'rb'))\n"
+            "print(Summary({'kind': 'y'}).covers(d._summary),"
+            " deepset({'kind': 'x'}, summary=True) <= d,"
+            " deepset({'kind': 'y'}, summary=True) <= d)"
+        )
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+        for seed, script in (("1", dump), ("2", load)):
+            env["PYTHONHASHSEED"] = seed
+            out = subprocess.run(
+                [sys.executable, "-c", script, path], env=env, check=True, stdout=subprocess.PIPE
+            ).stdout
+        assert out.split() == [b"True", b"True", b"False"]
+
+    def test_summary_parameters(self):
+        """Test Bloom filter tuning, and that differently sized Summaries remain comparable"""
+        bits, hashes = bloom_parameters(1000, 0.01)
+        assert 9000 < bits < 10000 and hashes == 7
+        assert bloom_parameters(1000, 0.001)[0] > bits
+        assert Summary([1, 2], bits=bits, hashes=hashes).covers(Summary([2]))
+        assert not Summary([1, 2], bits=bits, hashes=hashes).covers(Summary([1, 2, 2]))
+
+
+class TestRecords:
+    rows = [{"id": i, "kind": "xyz"[i % 3], "tags": {i % 2, i % 5}} for i in range(20)]
+
+    def test_is_records(self):
+        """Test detection of lists of mappings compared to long lists of homogeneous records"""
+        assert _is_records([{"id": 1}], self.rows)
+        assert not _is_records([{"id": 1}], self.rows[:4])
+        assert not _is_records([{"id": 1}, [1]], self.rows)
+        assert not _is_records([{"id": 1}], [1] + self.rows)
+
+    def test_compare_records(self):
+        """Test column-wise comparison of records"""
+        assert _compare_records([{"id": 3}, {"kind": "x"}], self.rows) == ComparisonResult.LT
+        assert _compare_records([{"kind": "y", "tags": {1}}], self.rows) == ComparisonResult.LT
+        assert _compare_records([{"id": 3}, {"id": 2}], self.rows) == ComparisonResult.FALSE
+        assert _compare_records([{"nope": 3}], self.rows) == ComparisonResult.FALSE
+        assert _compare_records([{"tags": {9}}], self.rows) == ComparisonResult.FALSE
+        assert _compare_records(self.rows, self.rows) == ComparisonResult.EQ
+        assert deepset([{"id": 1}, {}, {"kind": "z", "id": 17}]) < self.rows
+
+    def test_compare_not_records(self):
+        """Test that records are only checked as far as they are examined"""
+        rows = self.rows + [{"id": 20}]
+        assert _compare_records([{"id": 3}], rows) == ComparisonResult.LT
+        assert _compare_records([{"id": 20}], rows) is None
+        assert _compare_records([{"nope": 3}], rows) is None
+        assert _get_comparison_strength([{"id": 20}], rows) == ComparisonResult.LT
+        assert _get_comparison_strength([{"id": 3}, {"id": 20}], rows) == ComparisonResult.LT
+
+    def test_records_match_zip_compare(self, monkeypatch):
+        """Test that column-wise comparison yields the same results as zip_compare"""
+        rnd = random.Random(0)
+        for _ in range(200):
+            b = [{"x": rnd.randrange(3), "y": [rnd.randrange(3)]} for _ in range(20)]
+            if rnd.random() < 0.2:
+                b[rnd.randrange(20)] = {"x": rnd.randrange(3)}
+            a = [
+                {k: b[i][k] for k in rnd.sample(sorted(b[i]), rnd.randrange(len(b[i]) + 1))}
+                for i in sorted(rnd.sample(range(20), rnd.randrange(1, 6)))
+            ]
+            if rnd.random() < 0.3:
+                a.append({"x": 0, "y": [2]})
+            result = _get_comparison_strength(a, b)
+            monkeypatch.setattr(deepset_module, "RECORDS_MIN", 100)
+            assert _get_comparison_strength(a, b) == result
+            monkeypatch.undo()
+
+
+class TestMain:
+    records = [
+        b'{"id": 1, "kind": "x", "tags": [1, 2]}\n',
+        b'{"id": 2, "kind": "y", "tags": [2]}\n',
+        b"\n",
+        b"not json\n",
+        b'{"id": 3, "kind": "x"}',
+    ]
+
+    @pytest.fixture
+    def files(self, tmp_path):
+        pattern = tmp_path / "pattern.json"
+        pattern.write_text('{"kind": "x"}')
+        data = tmp_path / "data.jsonl"
+        data.write_bytes(b"".join(self.records))
+        return str(pattern), str(data)
+
+    def test_filter(self, files, capsysbinary):
+        """Test filtering JSONL records, in one or more processes and chunks"""
+        for args in (["-j", "1"], ["-j", "2", "--chunk", "8"]):
+            assert main(args + list(files)) == 0
+            out, err = capsysbinary.readouterr()
+            assert out == self.records[0] + self.records[4] + b"\n"
+            assert b"3 records (2 matched, 1 invalid)" in err
+
+    def test_classify(self, files, capsysbinary):
+        """Test classifying every JSONL line, with reversed operators"""
+        assert main(["-q", "-j", "1", "-c"] + list(files)) == 0
+        assert capsysbinary.readouterr() == (b"LT\nFALSE\nINVALID\nINVALID\nLT\n", b"")
+        assert main(["-q", "-j", "1", "-o", "ge"] + list(files)) == 1
+        assert capsysbinary.readouterr() == (b"", b"")
+        # Matches (and so exit status) follow --op when classifying, too
+        assert main(["-j", "1", "-c", "-o", "eq"] + list(files)) == 1
+        out, err = capsysbinary.readouterr()
+        assert out == b"LT\nFALSE\nINVALID\nINVALID\nLT\n"
+        assert b"3 records (0 matched, 1 invalid)" in err
+
+    def test_too_deep(self, files, capsysbinary):
+        """Test that records too deeply nested to parse or compare are invalid"""
+        pattern, data = files
+        deep = 600  # parses, but recursive comparison exceeds the recursion limit
+        with open(pattern, "w") as f:
+            f.write("[" * deep + "]" * deep)
+        with open(data, "wb") as f:
+            f.write(b"[" * 100000 + b"\n" + b"[" * deep + b"]" * deep + b"\n[]\n")
+        assert main(["-j", "1", "-c", pattern, data]) == 1
+        out, err = capsysbinary.readouterr()
+        assert out == b"INVALID\nINVALID\nFALSE\n"
+        assert b"1 records (0 matched, 2 invalid)" in err
+
+    def test_pattern_errors(self, files, tmp_path, capsysbinary):
+        """Test that missing or invalid patterns exit with status 2, like grep"""
+        pattern, data = files
+        missing = str(tmp_path / "missing.json")
+        assert main([missing, data]) == 2
+        assert capsysbinary.readouterr().err.startswith(f"deepset: {missing}: ".encode())
+        with open(pattern, "w") as f:
+            f.write("{not json")
+        assert main([pattern, data]) == 2
+        out, err = capsysbinary.readouterr()
+        assert out == b"" and err.startswith(f"deepset: {pattern}: ".encode())
+
+    def test_broken_pipe(self, files, tmp_path):
+        """Test that a reader closing the output (eg. | head -1) stops quietly, like grep"""
+        pattern, _ = files
+        data = tmp_path / "many.jsonl"
+        data.write_bytes(b'{"kind": "x", "padding": "................................"}\n' * 50000)
+        proc = subprocess.Popen(
+            [sys.executable, deepset_module.__file__, "-q", "-j", "1", pattern, str(data)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        assert proc.stdout.readline().startswith(b'{"kind": "x"')
+        proc.stdout.close()
+        assert proc.wait(timeout=60) == 0
+        assert proc.stderr.read() == b""